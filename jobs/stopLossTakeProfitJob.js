@@ -113,10 +113,13 @@ class MarketDataManager {
       }
     });
 
-    this.socket.on('market-data', (data) => {
-      if (data && data.symbol) {
-        marketDataCache.set(data.symbol, data);
-        console.log(`📊 Updated market data for ${data.symbol}: ${data.bid}/${data.ask}`);
+    // Ticks arrive batched: one { symbol: tick } market-data-batch frame per stream cycle
+    this.socket.on('market-data-batch', (batch) => {
+      for (const data of Object.values(batch || {})) {
+        if (data && data.symbol) {
+          marketDataCache.set(data.symbol, data);
+          console.log(`📊 Updated market data for ${data.symbol}: ${data.bid}/${data.ask}`);
+        }
       }
     });
 
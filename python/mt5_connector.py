@@ -1,510 +1,739 @@
-from flask import Flask, request, jsonify
+# Serving model: Flask + Flask-SocketIO on eventlet. Every HTTP request and Socket.IO connection is a
+# green thread on one hub; blocking MetaTrader5 SDK calls are handed to a single native I/O thread
+# (see on_mt5_thread), so handlers wait on MT5 without holding an OS thread or the hub. The price
+# stream is a single socketio background task, so fan-out costs one green thread, not one per client.
+import eventlet
+eventlet.monkey_patch()
+from eventlet import tpool
+from eventlet.patcher import original
+
+from flask import Flask, Response, request
 from flask_socketio import SocketIO, emit, disconnect
+from werkzeug.exceptions import HTTPException
 import MetaTrader5 as mt5
+import orjson
+import msgspec
+from trade_requests import trade_decoder, close_decoder
 import sys
+import gc
+import functools
 import time
+import hashlib
 import threading
 from datetime import datetime
 import logging
-from queue import Queue
+from logging.handlers import QueueHandler, QueueListener
+import sched
+from collections import namedtuple
 import asyncio
-
-# Configure logging
+from operator import attrgetter
+
+# Unpatched primitives for anything shared with the MT5 I/O thread, which is a real OS thread;
+# eventlet's green locks and queues can't wake waiters across OS threads
+_native_threading = original('threading')
+_native_queue = original('queue')
+_native_time = original('time')
+
+class NativeQueueHandler(QueueHandler):
+    def createLock(self):
+        self.lock = _native_threading.RLock()
+
+class NativeQueueListener(QueueListener):
+    def start(self):
+        self._thread = _native_threading.Thread(target=self._monitor, daemon=True, name="LogListener")
+        self._thread.start()
+
+# Configure logging; records are handed to a queue and written to stdout by a listener thread,
+# so the price stream and request handlers never block on the stream write
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+_log_queue = _native_queue.SimpleQueue()
+log_listener = NativeQueueListener(_log_queue, _log_handler)
+# prepare() formats with the queue handler's formatter before enqueueing; keep it to the bare
+# message so the StreamHandler's format is the only one applied
+_queue_handler = NativeQueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
     handlers=[
-        logging.StreamHandler(sys.stdout)
+        _queue_handler
     ]
 )
+log_listener.start()
 logger = logging.getLogger(__name__)
 
+# Every MetaTrader5 call runs on a single native tpool thread. The SDK serializes calls internally
+# anyway, so one thread removes lock contention, green threads wait on it without blocking the hub,
+# and connector state touched by MT5 calls needs no lock.
+tpool.set_num_threads(1)
+
+def on_mt5_thread(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        return tpool.execute(method, *args, **kwargs)
+    return wrapper
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+class ORJSONSocketCodec:
+    # python-socketio only needs dumps/loads and passes stdlib kwargs such as separators
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+def ojson(obj, status=200):
+    return Response(orjson.dumps(obj, option=ORJSON_OPTIONS), status=status, mimetype='application/json')
+
+_MSGPACK_ENC = msgspec.msgpack.Encoder()
+
+def wants_msgpack():
+    return 'application/x-msgpack' in request.headers.get('Accept', '')
+
+def negotiate(obj, status=200):
+    # Algo clients that send Accept: application/x-msgpack get the smaller binary body
+    if wants_msgpack():
+        response = Response(_MSGPACK_ENC.encode(obj), status=status, mimetype='application/x-msgpack')
+    else:
+        response = ojson(obj, status)
+    response.vary.add('Accept')
+    return response
+
+def json_body():
+    # Raw bytes straight into orjson; an empty body yields None like a missing payload
+    raw = request.get_data(cache=False)
+    return orjson.loads(raw) if raw else None
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'aurify@123'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', engineio_logger=False)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', engineio_logger=False, json=ORJSONSocketCodec)
+
+# Supported filling types for every 3-bit filling_mode mask, in preference order FOK, IOC, RETURN
+_FILLING_TABLE = {
+    mask: tuple(filling for bit, filling in ((1, mt5.ORDER_FILLING_FOK), (2, mt5.ORDER_FILLING_IOC), (4, mt5.ORDER_FILLING_RETURN)) if mask & bit)
+    for mask in range(8)
+}
+
+_POSITION_FIELDS = attrgetter('ticket', 'symbol', 'type', 'volume', 'price_open', 'price_current', 'sl', 'tp', 'profit', 'time', 'comment', 'magic')
+
+TRADE_ERROR_MESSAGES = {
+    10018: "Market closed",
+    10019: "Insufficient funds",
+    10020: "Prices changed",
+    10021: "Invalid request (check volume, symbol, or market status)",
+    10022: "Invalid SL/TP",
+    10017: "Invalid parameters",
+    10027: "AutoTrading disabled",
+    10030: "Invalid order filling type"
+}
+
+# Filling names for every 3-bit filling_mode mask, as reported by /symbol_filling
+_FILLING_NAMES = {
+    mask: tuple(name for bit, name in ((1, 'FOK'), (2, 'IOC'), (4, 'RETURN')) if mask & bit)
+    for mask in range(8)
+}
+
+SymbolInfoEntry = namedtuple('SymbolInfoEntry', ['ts', 'info', 'filling_priority'])
 
 class MT5Connector:
     def __init__(self):
         self.connected = False
         self.active_subscriptions = {}
-        self.price_threads = {}
         self.symbol_data = {}
-        self.mt5_lock = threading.Lock()
-        self.data_queue = Queue()
+        self._stream_lock = threading.Lock()
+        self._stream_thread = None
+        self.active_streams = 0
         self.batch_interval = 0.1
+        self.client_max_messages_in_frame = 16
+        self._emit_buffers = {}
+        self._scheduler = None
+        self._last_price_keys = {}
+        self._error_counts = {}
+        self._selected_symbols = set()
+        self.max_stream_errors = 5
+        self.info_cache_ttl = 60
+        # trade_mode follows the trading session, so the stream re-reads symbol info at least this often
+        self.trade_mode_max_age = 1.0
+        self._info_cache = {}
+        self._payload_pool = {}
+        self.stream_price_max_age_ms = 250
         self.shutdown_event = threading.Event()
 
+    @on_mt5_thread
     def connect(self, server, login, password):
         try:
-            with self.mt5_lock:
-                if not mt5.initialize():
-                    logger.error("MT5 initialization failed")
-                    return False, {"code": 1000, "message": "MT5 initialization failed"}
-                
-                authorized = mt5.login(login, password=password, server=server)
-                if not authorized:
-                    error = mt5.last_error()
-                    logger.error(f"Login failed: {error}")
-                    return False, {"code": error[0], "message": f"Login failed: {error[1]}"}
-                
-                self.connected = True
-                self.shutdown_event.clear()
-                account_info = mt5.account_info()
-                if account_info and not account_info.trade_expert:
-                    logger.warning("AutoTrading disabled")
-                    return False, {"code": 1001, "message": "AutoTrading disabled. Enable 'Algo Trading' in MT5"}
-                
-                logger.info(f"Connected to MT5, account: {account_info.login if account_info else None}")
-                return True, {"message": "Connected", "account": account_info.login if account_info else None}
+            if not mt5.initialize():
+                logger.error("MT5 initialization failed")
+                return False, {"code": 1000, "message": "MT5 initialization failed"}
+            
+            authorized = mt5.login(login, password=password, server=server)
+            if not authorized:
+                error = mt5.last_error()
+                logger.error(f"Login failed: {error}")
+                return False, {"code": error[0], "message": f"Login failed: {error[1]}"}
+            
+            self.connected = True
+            self.shutdown_event.clear()
+            self._selected_symbols.clear()
+            account_info = mt5.account_info()
+            if account_info and not account_info.trade_expert:
+                logger.warning("AutoTrading disabled")
+                return False, {"code": 1001, "message": "AutoTrading disabled. Enable 'Algo Trading' in MT5"}
+            
+            logger.info(f"Connected to MT5, account: {account_info.login if account_info else None}")
+            return True, {"message": "Connected", "account": account_info.login if account_info else None}
         except Exception as e:
-            logger.exception(f"Connection error: {str(e)}")
+            logger.exception("Connection error")
             return False, {"code": 1002, "message": str(e)}
 
     def disconnect(self):
         try:
-            with self.mt5_lock:
-                self.connected = False
-                self.shutdown_event.set()
-                
-                for symbol in list(self.price_threads.keys()):
-                    self.stop_price_stream(symbol)
-                
-                for thread in list(self.price_threads.values()):
-                    if thread.is_alive():
-                        thread.join(timeout=2)
-                
+            self.connected = False
+            self.shutdown_event.set()
+            with self._stream_lock:
                 self.active_subscriptions.clear()
-                self.price_threads.clear()
-                mt5.shutdown()
-                logger.info("Disconnected from MT5")
-                return True, {"message": "Disconnected"}
+                stream_thread = self._stream_thread
+            self._emit_buffers.clear()
+            if stream_thread and stream_thread is not threading.current_thread():
+                # Background tasks are green threads: join() has no timeout, so bound the wait here
+                with eventlet.Timeout(2, False):
+                    stream_thread.join()
+            
+            self._shutdown_mt5()
+            logger.info("Disconnected from MT5")
+            return True, {"message": "Disconnected"}
         except Exception as e:
-            logger.exception(f"Disconnect error: {str(e)}")
+            logger.exception("Disconnect error")
             return False, {"code": 1003, "message": str(e)}
 
+    @on_mt5_thread
+    def _shutdown_mt5(self):
+        self._info_cache.clear()
+        self._payload_pool.clear()
+        self._selected_symbols.clear()
+        mt5.shutdown()
+
+    @on_mt5_thread
     def get_symbols(self):
         try:
             if not self.connected:
                 logger.warning("Attempted to get symbols while not connected")
                 return False, {"code": 1004, "message": "Not connected"}
             
-            with self.mt5_lock:
-                symbols = mt5.symbols_get() or []
-                return True, [symbol.name for symbol in symbols]
+            symbols = mt5.symbols_get() or []
+            return True, [symbol.name for symbol in symbols]
         except Exception as e:
-            logger.exception(f"Error getting symbols: {str(e)}")
+            logger.exception("Error getting symbols")
             return False, {"code": 1005, "message": str(e)}
 
+    @on_mt5_thread
     def get_symbol_info(self, symbol):
         try:
             if not self.connected:
                 logger.warning(f"Attempted to get symbol info for {symbol} while not connected")
                 return False, {"code": 1004, "message": "Not connected"}
             
-            with self.mt5_lock:
-                if not mt5.symbol_select(symbol, True):
-                    logger.error(f"Symbol {symbol} not selected")
-                    return False, {"code": 1006, "message": f"Symbol {symbol} not selected"}
-                
-                info = mt5.symbol_info(symbol)
-                if not info:
-                    logger.error(f"Symbol {symbol} not found")
-                    return False, {"code": 1007, "message": f"Symbol {symbol} not found"}
-                
-                stops_level = getattr(info, 'stops_level', 0)
-                return True, {
-                    "name": info.name,
-                    "point": info.point,
-                    "digits": info.digits,
-                    "spread": info.spread,
-                    "trade_mode": info.trade_mode,
-                    "volume_min": info.volume_min,
-                    "volume_max": info.volume_max,
-                    "volume_step": info.volume_step,
-                    "stops_level": stops_level,
-                    "filling_mode": info.filling_mode
-                }
+            if not self._ensure_selected(symbol):
+                logger.error(f"Symbol {symbol} not selected")
+                return False, {"code": 1006, "message": f"Symbol {symbol} not selected"}
+            
+            info = mt5.symbol_info(symbol)
+            if not info:
+                logger.error(f"Symbol {symbol} not found")
+                return False, {"code": 1007, "message": f"Symbol {symbol} not found"}
+            
+            stops_level = getattr(info, 'stops_level', 0)
+            return True, {
+                "name": info.name,
+                "point": info.point,
+                "digits": info.digits,
+                "spread": info.spread,
+                "trade_mode": info.trade_mode,
+                "volume_min": info.volume_min,
+                "volume_max": info.volume_max,
+                "volume_step": info.volume_step,
+                "stops_level": stops_level,
+                "filling_mode": info.filling_mode
+            }
         except Exception as e:
-            logger.exception(f"Error getting symbol info for {symbol}: {str(e)}")
+            logger.exception("Error getting symbol info for %s", symbol)
             return False, {"code": 1008, "message": str(e)}
 
+    def _get_info_cached(self, symbol, max_age=None):
+        # Runs on the MT5 I/O thread; point, digits, volume limits and filling mode rarely change.
+        # Callers that depend on trade_mode pass a shorter max_age, 0 forces a live read.
+        now = time.monotonic()
+        cached = self._info_cache.get(symbol)
+        if cached and now - cached.ts < (self.info_cache_ttl if max_age is None else max_age):
+            return cached
+        info = mt5.symbol_info(symbol)
+        if not info:
+            return None
+        entry = SymbolInfoEntry(now, info, _FILLING_TABLE[info.filling_mode & 7])
+        self._info_cache[symbol] = entry
+        return entry
+
+    def _ensure_selected(self, symbol):
+        # Runs on the MT5 I/O thread; skips the symbol_select round trip for symbols already in Market Watch
+        if symbol in self._selected_symbols:
+            return True
+        if not mt5.symbol_select(symbol, True):
+            return False
+        self._selected_symbols.add(symbol)
+        return True
+
+    def _symbol_tick(self, symbol, wait=True):
+        # Runs on the MT5 I/O thread. No tick for a symbol cached as selected usually means it left Market Watch
+        # (or was only just selected): drop it from the cache, select it again and retry once.
+        # The stream passes wait=False: sleeping here would stall every queued MT5 call, the next cycle retries anyway.
+        tick = mt5.symbol_info_tick(symbol)
+        if tick:
+            return tick
+        self._selected_symbols.discard(symbol)
+        if wait:
+            _native_time.sleep(0.005)
+        if not self._ensure_selected(symbol):
+            return None
+        return mt5.symbol_info_tick(symbol)
+
+    @on_mt5_thread
     def get_price(self, symbol):
         try:
             if not self.connected:
                 logger.warning(f"Attempted to get price for {symbol} while not connected")
                 return False, {"code": 1004, "message": "Not connected"}
             
-            with self.mt5_lock:
-                if not mt5.symbol_select(symbol, True):
-                    logger.error(f"Symbol {symbol} not selected")
-                    return False, {"code": 1006, "message": f"Symbol {symbol} not selected"}
-                
-                time.sleep(0.05)
-                tick = mt5.symbol_info_tick(symbol)
-                
-                if not tick:
-                    rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_M1, 0, 1)
-                    if not rates or not len(rates):
-                        logger.error(f"No price data for {symbol}")
-                        return False, {"code": 1009, "message": f"No price data for {symbol}"}
-                    
-                    rate = rates[0]
-                    return True, {
-                        "symbol": symbol,
-                        "bid": rate['close'],
-                        "ask": rate['close'],
-                        "spread": 0,
-                        "time": datetime.fromtimestamp(rate['time']).isoformat(),
-                        "timestamp": time.time(),
-                        "high": rate['high'],
-                        "low": rate['low'],
-                        "marketStatus": "CLOSED"
-                    }
-                
-                symbol_info = mt5.symbol_info(symbol)
-                spread = (tick.ask - tick.bid) / symbol_info.point if symbol_info and symbol_info.point > 0 else 0
-                
-                current_data = self.symbol_data.get(symbol, {"high": None, "low": None, "last_close": None, "last_timestamp": None})
-                current_high = current_data["high"] or tick.bid
-                current_low = current_data["low"] or tick.bid
-                current_high = max(current_high, tick.bid, tick.ask)
-                current_low = min(current_low, tick.bid, tick.ask)
-                
-                self.symbol_data[symbol] = {
-                    "high": current_high,
-                    "low": current_low,
-                    "last_close": tick.bid if symbol_info and symbol_info.trade_mode == 0 else current_data.get("last_close"),
-                    "last_timestamp": datetime.fromtimestamp(tick.time).isoformat()
-                }
-                
-                return True, {
-                    "symbol": symbol,
-                    "bid": tick.bid,
-                    "ask": tick.ask,
-                    "spread": spread,
-                    "time": datetime.fromtimestamp(tick.time).isoformat(),
-                    "timestamp": time.time(),
-                    "high": current_high,
-                    "low": current_low,
-                    "marketStatus": "TRADEABLE" if symbol_info and symbol_info.trade_mode != 0 else "CLOSED"
-                }
+            # A streamed symbol was fetched within the last cycle, answer from that instead of another round trip.
+            # Copied here on the I/O thread, so the stream can't be halfway through refilling it.
+            if symbol in self.active_subscriptions:
+                streamed = self._payload_pool.get(symbol)
+                if streamed and time.time_ns() // 1_000_000 - streamed.get("timestamp", 0) <= self.stream_price_max_age_ms:
+                    return True, dict(streamed)
+            
+            if not self._ensure_selected(symbol):
+                logger.error(f"Symbol {symbol} not selected")
+                return False, {"code": 1006, "message": f"Symbol {symbol} not selected"}
+
+            return self._price_payload(symbol, self._symbol_tick(symbol))
         except Exception as e:
-            logger.exception(f"Error getting price for {symbol}: {str(e)}")
+            logger.exception("Error getting price for %s", symbol)
             return False, {"code": 1010, "message": str(e)}
 
-    def start_price_stream(self, symbol, client_id):
-        if symbol in self.price_threads:
-            if client_id not in self.active_subscriptions.get(symbol, []):
-                self.active_subscriptions.setdefault(symbol, []).append(client_id)
-            return
+    def _price_payload(self, symbol, tick, payload=None):
+        # Runs on the MT5 I/O thread with the symbol selected. Pass payload to fill a reused dict in place.
+        if payload is None:
+            payload = {"symbol": symbol}
+        if not tick:
+            rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_M1, 0, 1)
+            if rates is None or len(rates) == 0:
+                logger.error("No price data for %s", symbol)
+                return False, {"code": 1009, "message": f"No price data for {symbol}"}
+            
+            # Unbox the NumPy structured row once instead of per field access
+            rate = rates[0]
+            close = float(rate['close'])
+            payload["bid"] = close
+            payload["ask"] = close
+            payload["spread"] = 0
+            payload["time"] = int(rate['time']) * 1000
+            payload["timestamp"] = time.time_ns() // 1_000_000
+            payload["high"] = float(rate['high'])
+            payload["low"] = float(rate['low'])
+            payload["marketStatus"] = "CLOSED"
+            return True, payload
         
-        self.active_subscriptions[symbol] = [client_id]
+        cached = self._get_info_cached(symbol, self.trade_mode_max_age)
+        symbol_info = cached.info if cached else None
+        spread = (tick.ask - tick.bid) / symbol_info.point if symbol_info and symbol_info.point > 0 else 0
         
-        def price_worker():
-            last_price = None
-            error_count = 0
-            max_errors = 5
-            
-            while symbol in self.price_threads and self.connected and not self.shutdown_event.is_set():
-                try:
-                    success, price_data = self.get_price(symbol)
-                    if success:
-                        current_price = f"{price_data['bid']}-{price_data['ask']}"
-                        if current_price != last_price:
-                            socketio.emit('market-data', price_data, room=f'symbol_{symbol}')
-                            last_price = current_price
-                            error_count = 0
-                    else:
-                        error_count += 1
-                        logger.error(f"Failed to get price for {symbol}: {price_data.get('message', 'Unknown error')}")
-                        if error_count >= max_errors:
-                            logger.error(f"Too many errors for {symbol}, stopping stream")
-                            break
-                    
-                    time.sleep(self.batch_interval)
-                except Exception as e:
-                    error_count += 1
-                    logger.exception(f"Error streaming {symbol}: {str(e)}")
-                    if error_count >= max_errors:
-                        logger.error(f"Too many errors for {symbol}, stopping stream")
-                        break
-            if symbol in self.price_threads:
-                del self.price_threads[symbol]
-            if symbol in self.active_subscriptions:
-                del self.active_subscriptions[symbol]
-            logger.info(f"Price stream ended for {symbol}")
+        current_data = self.symbol_data.get(symbol)
+        if current_data is None:
+            current_data = self.symbol_data[symbol] = {"high": None, "low": None, "last_close": None, "last_timestamp": None}
+        current_high = current_data["high"] or tick.bid
+        current_low = current_data["low"] or tick.bid
+        current_high = max(current_high, tick.bid, tick.ask)
+        current_low = min(current_low, tick.bid, tick.ask)
+        
+        current_data["high"] = current_high
+        current_data["low"] = current_low
+        if symbol_info and symbol_info.trade_mode == 0:
+            current_data["last_close"] = tick.bid
+        current_data["last_timestamp"] = tick.time_msc
         
-        thread = threading.Thread(target=price_worker, daemon=True, name=f"PriceStream-{symbol}")
-        self.price_threads[symbol] = thread
-        thread.start()
-        logger.info(f"Started price stream for {symbol} with client {client_id}")
+        payload["bid"] = tick.bid
+        payload["ask"] = tick.ask
+        payload["spread"] = spread
+        # Epoch milliseconds; tick.time_msc is tick.time * 1000 plus the millisecond part
+        payload["time"] = tick.time_msc
+        payload["timestamp"] = time.time_ns() // 1_000_000
+        payload["high"] = current_high
+        payload["low"] = current_low
+        payload["marketStatus"] = "TRADEABLE" if symbol_info and symbol_info.trade_mode != 0 else "CLOSED"
+        return True, payload
 
-    def stop_price_stream(self, symbol, client_id=None):
+    def start_price_stream(self, symbol, client_id):
+        with self._stream_lock:
+            self.active_subscriptions.setdefault(symbol, set()).add(client_id)
+            if self._stream_thread is None:
+                self._start_stream()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Started price stream for %s with client %s", symbol, client_id)
+
+    def _start_stream(self):
+        # Caller must hold self._stream_lock. One scheduler thread drives the tick fetch and flushes
+        # the emits after it; each run gets its own scheduler so a stopping run can't revive itself.
+        self._last_price_keys.clear()
+        self._error_counts.clear()
+        scheduler = sched.scheduler(time.monotonic, socketio.sleep)
+        now = time.monotonic()
+        scheduler.enterabs(now, 0, self._tick, (scheduler, now))
+        self._scheduler = scheduler
+        self._stream_thread = socketio.start_background_task(self._run_stream, scheduler)
+
+    def _run_stream(self, scheduler):
+        # Counted here rather than polled with is_alive() so /health just reads an int
+        self.active_streams += 1
         try:
-            if symbol not in self.active_subscriptions:
+            scheduler.run()
+        finally:
+            self.active_streams -= 1
+
+    def _tick(self, scheduler, deadline):
+        with self._stream_lock:
+            if not self.active_subscriptions or not self.connected or self.shutdown_event.is_set():
+                self._scheduler = None
+                self._stream_thread = None
+                logger.info("Price stream ended")
                 return
-            if client_id:
-                if client_id in self.active_subscriptions[symbol]:
-                    self.active_subscriptions[symbol].remove(client_id)
-                if not self.active_subscriptions[symbol]:
-                    del self.active_subscriptions[symbol]
-                    if symbol in self.price_threads:
-                        del self.price_threads[symbol]
-                    logger.info(f"Stopped price stream for {symbol} (client {client_id})")
+            symbols = list(self.active_subscriptions.keys())
+        
+        try:
+            self._queue_results(self._fetch_prices(symbols))
+            self._flush()
+        except Exception:
+            logger.exception("Error in price stream cycle")
+        
+        # Fixed-rate schedule; after an overrun start the next cycle immediately instead of bursting to catch up
+        deadline = max(deadline + self.batch_interval, time.monotonic())
+        scheduler.enterabs(deadline, 0, self._tick, (scheduler, deadline))
+
+    @on_mt5_thread
+    def _fetch_prices(self, symbols):
+        # Every subscribed symbol is fetched in one trip to the MT5 I/O thread
+        results = []
+        for symbol in symbols:
+            try:
+                if not self._ensure_selected(symbol):
+                    results.append((symbol, False, {"code": 1006, "message": f"Symbol {symbol} not selected"}))
+                    continue
+                payload = self._payload_pool.get(symbol)
+                if payload is None:
+                    payload = self._payload_pool[symbol] = {"symbol": symbol}
+                tick = self._symbol_tick(symbol, wait=False)
+                if tick is None and symbol not in self._selected_symbols:
+                    # Could not be put back into Market Watch; count it as an error instead of streaming the M1 fallback
+                    results.append((symbol, False, {"code": 1006, "message": f"Symbol {symbol} not selected"}))
+                    continue
+                success, price_data = self._price_payload(symbol, tick, payload)
+                if not success:
+                    # Selection state belongs to this thread; a failed symbol is selected afresh next cycle
+                    self._selected_symbols.discard(symbol)
+                results.append((symbol, success, price_data))
+            except Exception as e:
+                logger.exception("Error streaming %s", symbol)
+                self._selected_symbols.discard(symbol)
+                results.append((symbol, False, {"code": 1010, "message": str(e)}))
+        return results
+
+    def _queue_results(self, results):
+        for symbol, success, price_data in results:
+            if success:
+                if symbol not in self.active_subscriptions:
+                    # Unsubscribed while this batch was in flight; keep no key so a re-subscribe gets a frame at once
+                    continue
+                price_key = hash((price_data['bid'], price_data['ask']))
+                if price_key != self._last_price_keys.get(symbol):
+                    self._queue_emit(symbol, price_data)
+                    self._last_price_keys[symbol] = price_key
+                self._error_counts[symbol] = 0
             else:
-                if symbol in self.active_subscriptions:
+                error_count = self._error_counts[symbol] = self._error_counts.get(symbol, 0) + 1
+                logger.error("Failed to get price for %s: %s", symbol, price_data.get('message', 'Unknown error'))
+                if error_count >= self.max_stream_errors:
+                    logger.error("Too many errors for %s, stopping stream", symbol)
+                    self.stop_price_stream(symbol)
+                    self._error_counts.pop(symbol, None)
+
+    def _queue_emit(self, symbol, payload):
+        # Buffer per client across all of its symbols; latest tick wins if one is already pending
+        for client_id in self.active_subscriptions.get(symbol, ()):
+            self._emit_buffers.setdefault(client_id, {})[symbol] = payload
+
+    def _flush(self):
+        # Runs right after each fetch cycle, so every client gets one {symbol: tick} frame per cycle
+        # instead of one per subscribed symbol. Frames differ per client, so they go out as plain
+        # events: a binary attachment would cost a second websocket message per frame.
+        buffers, self._emit_buffers = self._emit_buffers, {}
+        max_frame = self.client_max_messages_in_frame
+        for client_id, batch in buffers.items():
+            if len(batch) <= max_frame:
+                socketio.emit('market-data-batch', batch, room=client_id)
+                continue
+            # Cap frame size so one client watching many symbols doesn't get a single oversized frame
+            items = list(batch.items())
+            for start in range(0, len(items), max_frame):
+                socketio.emit('market-data-batch', dict(items[start:start + max_frame]), room=client_id)
+
+    def stop_price_stream(self, symbol, client_id=None):
+        try:
+            with self._stream_lock:
+                if symbol not in self.active_subscriptions:
+                    return
+                if client_id:
+                    self.active_subscriptions[symbol].discard(client_id)
+                    if not self.active_subscriptions[symbol]:
+                        del self.active_subscriptions[symbol]
+                        self._last_price_keys.pop(symbol, None)
+                        logger.info(f"Stopped price stream for {symbol} (client {client_id})")
+                else:
                     del self.active_subscriptions[symbol]
-                if symbol in self.price_threads:
-                    del self.price_threads[symbol]
-                logger.info(f"Stopped price stream for {symbol} (all clients)")
-        except Exception as e:
-            logger.exception(f"Error stopping price stream for {symbol}: {str(e)}")
+                    self._last_price_keys.pop(symbol, None)
+                    logger.info(f"Stopped price stream for {symbol} (all clients)")
+        except Exception:
+            logger.exception("Error stopping price stream for %s", symbol)
 
+    @on_mt5_thread
     def place_trade(self, symbol, volume, order_type, sl_distance=None, tp_distance=None, comment="", magic=0):
         try:
             if not self.connected:
                 return False, "Not connected"
-            with self.mt5_lock:
-                if not mt5.symbol_select(symbol, True):
-                    return False, f"Symbol {symbol} not selected"
-                info = mt5.symbol_info(symbol)
-                if not info:
-                    return False, f"Symbol {symbol} not found"
-                if info.trade_mode == 0:
-                    return False, f"Symbol {symbol} not tradable"
-                stop_level = getattr(info, 'stops_level', 0) * info.point
-                tick = mt5.symbol_info_tick(symbol)
-                if not tick:
-                    return False, f"No price for {symbol}"
-                order_type = order_type.upper()
-                if order_type == "BUY":
-                    mt5_type = mt5.ORDER_TYPE_BUY
-                    price = tick.ask
-                    sl = round(price - sl_distance, info.digits) if sl_distance and sl_distance > 0 else 0
-                    tp = round(price + tp_distance, info.digits) if tp_distance and tp_distance > 0 else 0
-                elif order_type == "SELL":
-                    mt5_type = mt5.ORDER_TYPE_SELL
-                    price = tick.bid
-                    sl = round(price + sl_distance, info.digits) if sl_distance and sl_distance > 0 else 0
-                    tp = round(price - tp_distance, info.digits) if tp_distance and tp_distance > 0 else 0
+            if not self._ensure_selected(symbol):
+                return False, f"Symbol {symbol} not selected"
+            # Live read: the tradable check must see a session open or close as it happens
+            cached = self._get_info_cached(symbol, 0)
+            if not cached:
+                return False, f"Symbol {symbol} not found"
+            info = cached.info
+            if info.trade_mode == 0:
+                return False, f"Symbol {symbol} not tradable"
+            stop_level = getattr(info, 'stops_level', 0) * info.point
+            tick = self._symbol_tick(symbol)
+            if not tick:
+                return False, f"No price for {symbol}"
+            order_type = order_type.upper()
+            if order_type == "BUY":
+                mt5_type = mt5.ORDER_TYPE_BUY
+                price = tick.ask
+                sl = round(price - sl_distance, info.digits) if sl_distance and sl_distance > 0 else 0
+                tp = round(price + tp_distance, info.digits) if tp_distance and tp_distance > 0 else 0
+            elif order_type == "SELL":
+                mt5_type = mt5.ORDER_TYPE_SELL
+                price = tick.bid
+                sl = round(price + sl_distance, info.digits) if sl_distance and sl_distance > 0 else 0
+                tp = round(price - tp_distance, info.digits) if tp_distance and tp_distance > 0 else 0
+            else:
+                return False, f"Invalid order type {order_type}"
+            volume = max(info.volume_min, min(info.volume_max, round(volume / info.volume_step) * info.volume_step))
+
+            supported_fillings = cached.filling_priority
+            if not supported_fillings:
+                logger.error(f"No supported filling modes for {symbol}")
+                return False, f"No supported filling modes for {symbol}"
+
+            # Prefer FOK, then IOC, then RETURN
+            filling_type = supported_fillings[0]  # Take the first supported filling mode
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Selected filling type: %s for symbol %s", filling_type, symbol)
+
+            request = {
+                "action": mt5.TRADE_ACTION_DEAL,
+                "symbol": symbol,
+                "volume": volume,
+                "type": mt5_type,
+                "price": price,
+                "deviation": 20,
+                "magic": magic,
+                "comment": comment,
+                "type_time": mt5.ORDER_TIME_GTC,
+                "type_filling": filling_type
+            }
+            if sl_distance and sl_distance > 0 and sl != 0:
+                if sl_distance < stop_level:
+                    sl_distance = stop_level
+                    sl = round(price - sl_distance if order_type == "BUY" else price + sl_distance, info.digits)
+                request["sl"] = sl
+            if tp_distance and tp_distance > 0 and tp != 0:
+                if tp_distance < stop_level:
+                    tp_distance = stop_level
+                    tp = round(price + tp_distance if order_type == "BUY" else price - tp_distance, info.digits)
+                request["tp"] = tp
+            result = mt5.order_send(request)
+            if result is None:
+                error = mt5.last_error()
+                error_code = error[0] if isinstance(error, tuple) else getattr(error, 'code', -1)
+                error_comment = error[1] if isinstance(error, tuple) else getattr(error, 'comment', 'Unknown error')
+                if error_code == 10013:  # Requote, refresh the price and try with higher deviation
+                    tick = mt5.symbol_info_tick(symbol)
+                    if tick:
+                        request["price"] = tick.ask if order_type == "BUY" else tick.bid
+                    request["deviation"] = 50
+                    result = mt5.order_send(request)
+                    if result is None:
+                        error = mt5.last_error()
+                        error_code = error[0] if isinstance(error, tuple) else getattr(error, 'code', -1)
+                        error_comment = error[1] if isinstance(error, tuple) else getattr(error, 'comment', 'Unknown error')
+                        return False, f"Order failed: Code: {error_code} - {error_comment}"
                 else:
-                    return False, f"Invalid order type {order_type}"
-                volume = max(info.volume_min, min(info.volume_max, round(volume / info.volume_step) * info.volume_step))
-
-                # Determine the appropriate filling type
-                filling_mode = info.filling_mode
-                supported_fillings = []
-                if filling_mode & 1:  # FOK
-                    supported_fillings.append(mt5.ORDER_FILLING_FOK)
-                if filling_mode & 2:  # IOC
-                    supported_fillings.append(mt5.ORDER_FILLING_IOC)
-                if filling_mode & 4:  # RETURN
-                    supported_fillings.append(mt5.ORDER_FILLING_RETURN)
-
-                if not supported_fillings:
-                    logger.error(f"No supported filling modes for {symbol}")
-                    return False, f"No supported filling modes for {symbol}"
-
-                # Prefer FOK, then IOC, then RETURN
-                filling_type = supported_fillings[0]  # Take the first supported filling mode
-                logger.info("Selected filling type: {filling_type} for symbol {symbol}")
-
-                request = {
-                    "action": mt5.TRADE_ACTION_DEAL,
-                    "symbol": symbol,
-                    "volume": volume,
-                    "type": mt5_type,
-                    "price": price,
-                    "deviation": 20,
-                    "magic": magic,
+                    return False, f"Order failed: Code: {error_code} - {error_comment}"
+            if result.retcode == mt5.TRADE_RETCODE_DONE:
+                return True, {
+                    "order": result.order,
+                    "deal": result.deal,
+                    "volume": result.volume,
+                    "price": result.price,
+                    "sl": sl,
+                    "tp": tp,
                     "comment": comment,
-                    "type_time": mt5.ORDER_TIME_GTC,
-                    "type_filling": filling_type
+                    "retcode": result.retcode
                 }
-                if sl_distance and sl_distance > 0 and sl != 0:
-                    if sl_distance < stop_level:
-                        sl_distance = stop_level
-                        sl = round(price - sl_distance if order_type == "BUY" else price + sl_distance, info.digits)
-                    request["sl"] = sl
-                if tp_distance and tp_distance > 0 and tp != 0:
-                    if tp_distance < stop_level:
-                        tp_distance = stop_level
-                        tp = round(price + tp_distance if order_type == "BUY" else price - tp_distance, info.digits)
-                    request["tp"] = tp
+            error_msg = TRADE_ERROR_MESSAGES.get(result.retcode, f"Error {result.retcode}")
+            return False, f"Order failed: {error_msg}"
+        except Exception as e:
+            logger.exception("Error placing trade")
+            return False, str(e)
+
+    @on_mt5_thread
+    def close_trade(self, ticket, volume=None, symbol=None, max_retries=3):
+        try:
+            if not self.connected:
+                return False, "Not connected"
+            position = mt5.positions_get(ticket=ticket)
+            if not position:
+                return False, f"Position {ticket} not found"
+            pos = position[0]
+            symbol = symbol or pos.symbol
+            position_type = "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL"
+            close_type = mt5.ORDER_TYPE_SELL if pos.type == mt5.POSITION_TYPE_BUY else mt5.ORDER_TYPE_BUY
+            if volume is None:
+                volume = pos.volume
+            else:
+                volume = min(volume, pos.volume)
+            if not self._ensure_selected(symbol):
+                return False, f"Symbol {symbol} not selected"
+            # Live read: the tradable check must see a session open or close as it happens
+            cached = self._get_info_cached(symbol, 0)
+            if not cached:
+                return False, f"Symbol {symbol} not found"
+            info = cached.info
+            if info.trade_mode == 0:
+                return False, f"Symbol {symbol} not tradable"
+            volume = max(info.volume_min, min(info.volume_max, round(volume / info.volume_step) * info.volume_step))
+            if volume < info.volume_min:
+                return False, f"Volume {volume} below minimum {info.volume_min}"
+            if volume > info.volume_max:
+                return False, f"Volume {volume} exceeds maximum {info.volume_max}"
+            supported_fillings = cached.filling_priority
+            if not supported_fillings:
+                logger.error(f"No supported filling modes for {symbol}")
+                return False, f"No supported filling modes for {symbol}"
+            # Built once; each attempt only refreshes price, deviation and, after a 10021, the filling type
+            request = {
+                "action": mt5.TRADE_ACTION_DEAL,
+                "symbol": symbol,
+                "volume": volume,
+                "type": close_type,
+                "position": ticket,
+                "magic": pos.magic,
+                "comment": f"Close {ticket}",
+                "type_filling": supported_fillings[0]
+            }
+            closes_buy = pos.type == mt5.POSITION_TYPE_BUY
+            for attempt in range(max_retries):
+                tick = self._symbol_tick(symbol)
+                if not tick:
+                    return False, f"No price for {symbol}"
+                request["price"] = tick.bid if closes_buy else tick.ask
+                request["deviation"] = 20 + attempt * 10
                 result = mt5.order_send(request)
                 if result is None:
                     error = mt5.last_error()
                     error_code = error[0] if isinstance(error, tuple) else getattr(error, 'code', -1)
                     error_comment = error[1] if isinstance(error, tuple) else getattr(error, 'comment', 'Unknown error')
-                    if error_code == 10013:  # Requote, try with higher deviation
-                        request["deviation"] = 50
-                        result = mt5.order_send(request)
-                        if result is None:
-                            error = mt5.last_error()
-                            error_code = error[0] if isinstance(error, tuple) else getattr(error, 'code', -1)
-                            error_comment = error[1] if isinstance(error, tuple) else getattr(error, 'comment', 'Unknown error')
-                            return False, f"Order failed: Code: {error_code} - {error_comment}"
-                    else:
-                        return False, f"Order failed: Code: {error_code} - {error_comment}"
+                    return False, f"Close failed: Code: {error_code} - {error_comment}"
                 if result.retcode == mt5.TRADE_RETCODE_DONE:
                     return True, {
-                        "order": result.order,
                         "deal": result.deal,
-                        "volume": result.volume,
+                        "retcode": result.retcode,
                         "price": result.price,
-                        "sl": sl,
-                        "tp": tp,
-                        "comment": comment,
-                        "retcode": result.retcode
-                    }
-                error_codes = {
-                    10018: "Market closed",
-                    10019: "Insufficient funds",
-                    10020: "Prices changed",
-                    10021: "Invalid request (check volume, symbol, or market status)",
-                    10022: "Invalid SL/TP",
-                    10017: "Invalid parameters",
-                    10027: "AutoTrading disabled",
-                    10030: "Invalid order filling type"
-                }
-                error_msg = error_codes.get(result.retcode, f"Error {result.retcode}")
-                return False, f"Order failed: {error_msg}"
-        except Exception as e:
-            logger.exception(f"Error placing trade: {str(e)}")
-            return False, str(e)
-
-    def close_trade(self, ticket, volume=None, symbol=None, max_retries=3):
-        try:
-            if not self.connected:
-                return False, "Not connected"
-            with self.mt5_lock:
-                position = mt5.positions_get(ticket=ticket)
-                if not position:
-                    return False, f"Position {ticket} not found"
-                pos = position[0]
-                symbol = symbol or pos.symbol
-                position_type = "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL"
-                close_type = mt5.ORDER_TYPE_SELL if pos.type == mt5.POSITION_TYPE_BUY else mt5.ORDER_TYPE_BUY
-                if volume is None:
-                    volume = pos.volume
-                else:
-                    volume = min(volume, pos.volume)
-                if not mt5.symbol_select(symbol, True):
-                    return False, f"Symbol {symbol} not selected"
-                info = mt5.symbol_info(symbol)
-                if not info:
-                    return False, f"Symbol {symbol} not found"
-                if info.trade_mode == 0:
-                    return False, f"Symbol {symbol} not tradable"
-                volume = max(info.volume_min, min(info.volume_max, round(volume / info.volume_step) * info.volume_step))
-                if volume < info.volume_min:
-                    return False, f"Volume {volume} below minimum {info.volume_min}"
-                if volume > info.volume_max:
-                    return False, f"Volume {volume} exceeds maximum {info.volume_max}"
-                filling_mode = info.filling_mode
-                supported_fillings = []
-                if filling_mode & 1:
-                    supported_fillings.append(mt5.ORDER_FILLING_FOK)
-                if filling_mode & 2:
-                    supported_fillings.append(mt5.ORDER_FILLING_IOC)
-                if filling_mode & 4:
-                    supported_fillings.append(mt5.ORDER_FILLING_RETURN)
-                if not supported_fillings:
-                    logger.error(f"No supported filling modes for {symbol}")
-                    return False, f"No supported filling modes for {symbol}"
-                filling_type = supported_fillings[0]  # First supported
-                for attempt in range(max_retries):
-                    tick = mt5.symbol_info_tick(symbol)
-                    if not tick:
-                        return False, f"No price for {symbol}"
-                    price = tick.bid if pos.type == mt5.POSITION_TYPE_BUY else tick.ask
-                    request = {
-                        "action": mt5.TRADE_ACTION_DEAL,
+                        "volume": result.volume,
+                        "profit": pos.profit,
                         "symbol": symbol,
-                        "volume": volume,
-                        "type": close_type,
-                        "position": ticket,
-                        "price": price,
-                        "magic": pos.magic,
-                        "comment": f"Close {ticket}",
-                        "type_filling": filling_type,
-                        "deviation": 20 + attempt * 10
+                        "position_type": position_type
                     }
-                    result = mt5.order_send(request)
-                    if result is None:
-                        error = mt5.last_error()
-                        error_code = error[0] if isinstance(error, tuple) else getattr(error, 'code', -1)
-                        error_comment = error[1] if isinstance(error, tuple) else getattr(error, 'comment', 'Unknown error')
-                        return False, f"Close failed: Code: {error_code} - {error_comment}"
-                    if result.retcode == mt5.TRADE_RETCODE_DONE:
-                        return True, {
-                            "deal": result.deal,
-                            "retcode": result.retcode,
-                            "price": result.price,
-                            "volume": result.volume,
-                            "profit": pos.profit,
-                            "symbol": symbol,
-                            "position_type": position_type
-                        }
-                    if result.retcode == 10021 and attempt < max_retries - 1:
-                        filling_type = supported_fillings[1] if len(supported_fillings) > 1 else filling_type
-                        time.sleep(0.5)
-                        continue
-                    error_codes = {
-                        10018: "Market closed",
-                        10019: "Insufficient funds",
-                        10020: "Prices changed",
-                        10021: "Invalid request (check volume, symbol, or market status)",
-                        10022: "Invalid SL/TP",
-                        10017: "Invalid parameters",
-                        10027: "AutoTrading disabled",
-                        10030: "Invalid order filling type"
-                    }
-                    error_msg = error_codes.get(result.retcode, f"Error {result.retcode}")
-                    return False, f"Close failed: {error_msg}"
-                return False, f"Close failed after {max_retries} attempts"
+                if result.retcode == 10021 and attempt < max_retries - 1:
+                    request["type_filling"] = supported_fillings[min(attempt + 1, len(supported_fillings) - 1)]
+                    _native_time.sleep(0.5)
+                    continue
+                error_msg = TRADE_ERROR_MESSAGES.get(result.retcode, f"Error {result.retcode}")
+                return False, f"Close failed: {error_msg}"
+            return False, f"Close failed after {max_retries} attempts"
         except Exception as e:
-            logger.exception(f"Error closing trade: {str(e)}")
+            logger.exception("Error closing trade")
             return False, str(e)
 
+    @on_mt5_thread
     def get_positions(self):
         try:
             if not self.connected:
                 logger.warning("Attempted to get positions while not connected")
                 return False, {"code": 1004, "message": "Not connected"}
-            with self.mt5_lock:
-                positions = mt5.positions_get()
-                if not positions:
-                    return True, []
-                result = []
-                for pos in positions:
-                    try:
-                        result.append({
-                            "ticket": pos.ticket,
-                            "symbol": pos.symbol,
-                            "type": "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL",
-                            "volume": pos.volume,
-                            "price_open": pos.price_open,
-                            "price_current": pos.price_current,
-                            "sl": pos.sl,
-                            "tp": pos.tp,
-                            "profit": pos.profit,
-                            "time": datetime.fromtimestamp(pos.time).isoformat(),
-                            "comment": pos.comment,
-                            "magic": pos.magic
-                        })
-                    except Exception as e:
-                        logger.error(f"Error processing position {pos.ticket}: {str(e)}")
-                        continue
-                logger.info(f"Retrieved {len(result)} open positions")
-                return True, result
+            positions = mt5.positions_get()
+            if not positions:
+                return True, []
+            # Pull all fields per row in one C-level attrgetter call
+            result = []
+            buy_type = mt5.POSITION_TYPE_BUY
+            for ticket, symbol, pos_type, volume, price_open, price_current, sl, tp, profit, pos_time, comment, magic in map(_POSITION_FIELDS, positions):
+                try:
+                    result.append({
+                        "ticket": ticket,
+                        "symbol": symbol,
+                        "type": "BUY" if pos_type == buy_type else "SELL",
+                        "volume": volume,
+                        "price_open": price_open,
+                        "price_current": price_current,
+                        "sl": sl,
+                        "tp": tp,
+                        "profit": profit,
+                        "time": datetime.fromtimestamp(pos_time).isoformat(),
+                        "comment": comment,
+                        "magic": magic
+                    })
+                except Exception as e:
+                    logger.error(f"Error processing position {ticket}: {str(e)}")
+                    continue
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Retrieved %d open positions", len(result))
+            return True, result
         except Exception as e:
-            logger.exception(f"Error getting positions: {str(e)}")
+            logger.exception("Error getting positions")
             return False, {"code": 1014, "message": str(e)}
 
 # Global connector instance
 connector = MT5Connector()
 
+@functools.lru_cache(maxsize=4096)
+def _symbol_filling_cached(symbol):
+    # filling_mode is fixed per symbol for a broker session; failures raise so they are never cached
+    success, result = connector.get_symbol_info(symbol)
+    if not success:
+        raise KeyError(result)
+    filling_mode = result.get('filling_mode', 0)
+    return filling_mode, _FILLING_NAMES[filling_mode & 7]
+
 # WebSocket Event Handlers
 @socketio.on('connect')
 def handle_connect():
@@ -542,7 +771,6 @@ def handle_request_data(symbols):
         symbols = [symbols] if symbols else []
     for symbol in symbols:
         try:
-            socketio.server.enter_room(client_id, f'symbol_{symbol}')
             connector.start_price_stream(symbol, client_id)
         except Exception as e:
             logger.error(f"Error starting stream for {symbol}: {str(e)}")
@@ -556,207 +784,228 @@ def handle_stop_data(symbols):
         symbols = [symbols] if symbols else []
     for symbol in symbols:
         try:
-            socketio.server.leave_room(client_id, f'symbol_{symbol}')
             connector.stop_price_stream(symbol, client_id)
         except Exception as e:
             logger.error(f"Error stopping stream for {symbol}: {str(e)}")
 
 # REST API Endpoints
+_HEALTH_PREFIX = b'{"success":true,"data":{"status":"running","connected":'
+
+POSITIONS_CACHE_TTL = 0.05
+PositionsEntry = namedtuple('PositionsEntry', ['ts', 'body', 'mimetype', 'etag'])
+# Keyed by wants_msgpack() so JSON and msgpack clients each get their own encoded body
+_positions_cache = {}
+
 @app.route('/connect', methods=['POST'])
 def connect():
     try:
-        data = request.json
-        if not data:
-            logger.error("No JSON data provided in connect request")
-            return jsonify({"success": False, "error": {"code": 3000, "message": "No JSON data provided"}}), 400
-        server = data.get('server')
-        login = data.get('login')
-        password = data.get('password')
-        if not all([server, login, password]):
-            logger.error("Missing server, login, or password in connect request")
-            return jsonify({"success": False, "error": {"code": 3001, "message": "Missing server, login, or password"}}), 400
-        success, result = connector.connect(server, login, password)
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in connect endpoint: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3002, "message": str(e)}}), 500
+        data = json_body()
+    except orjson.JSONDecodeError as e:
+        logger.error("Invalid JSON in connect request: %s", e)
+        return ojson({"success": False, "error": {"code": 3000, "message": f"Invalid JSON data: {e}"}}, 400)
+    if not data:
+        logger.error("No JSON data provided in connect request")
+        return ojson({"success": False, "error": {"code": 3000, "message": "No JSON data provided"}}, 400)
+    server = data.get('server')
+    login = data.get('login')
+    password = data.get('password')
+    if not (server and login and password):
+        logger.error("Missing server, login, or password in connect request")
+        return ojson({"success": False, "error": {"code": 3001, "message": "Missing server, login, or password"}}, 400)
+    success, result = connector.connect(server, login, password)
+    _symbol_filling_cached.cache_clear()
+    _positions_cache.clear()
+    if success:
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/disconnect', methods=['POST'])
 def disconnect_endpoint():
-    try:
-        success, result = connector.disconnect()
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in disconnect endpoint: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3003, "message": str(e)}}), 500
+    success, result = connector.disconnect()
+    _symbol_filling_cached.cache_clear()
+    _positions_cache.clear()
+    if success:
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/symbols', methods=['GET'])
 def get_symbols():
-    try:
-        success, result = connector.get_symbols()
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in symbols endpoint: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3004, "message": str(e)}}), 500
+    success, result = connector.get_symbols()
+    if success:
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/symbol_info/<symbol>', methods=['GET'])
 @app.route('/symbol/<symbol>', methods=['GET'])
 def get_symbol_info(symbol):
-    try:
-        success, result = connector.get_symbol_info(symbol)
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in symbol_info endpoint for {symbol}: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3005, "message": str(e)}}), 500
+    success, result = connector.get_symbol_info(symbol)
+    if success:
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/price/<symbol>', methods=['GET'])
 def get_price(symbol):
-    try:
-        success, result = connector.get_price(symbol)
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in price endpoint for {symbol}: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3006, "message": str(e)}}), 500
+    success, result = connector.get_price(symbol)
+    if success:
+        return negotiate({"success": True, "data": result})
+    else:
+        return negotiate({"success": False, "error": result}, 400)
 
 @app.route('/trade', methods=['POST'])
 def trade():
+    raw = request.get_data(cache=False)
+    if not raw:
+        return ojson({"success": False, "error": "No JSON data provided"}, 400)
     try:
-        data = request.json
-        if not data:
-            return jsonify({"success": False, "error": "No JSON data provided"}), 400
-        symbol = data.get('symbol')
-        volume = float(data.get('volume', 0.1))
-        order_type = data.get('type')
-        sl_distance = float(data.get('sl_distance', 0)) if data.get('sl_distance') else None
-        tp_distance = float(data.get('tp_distance', 0)) if data.get('tp_distance') else None
-        comment = data.get('comment', '')
-        magic = int(data.get('magic', 0))
-        if not all([symbol, order_type]):
-            return jsonify({"success": False, "error": "Missing symbol or order type"}), 400
-        success, result = connector.place_trade(symbol, volume, order_type, sl_distance, tp_distance, comment, magic)
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except ValueError as e:
-        return jsonify({"success": False, "error": f"Invalid numeric value: {str(e)}"}), 400
-    except Exception as e:
-        logger.exception(f"Error in trade endpoint: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        req = trade_decoder.decode(raw)
+    except msgspec.DecodeError as e:
+        return ojson({"success": False, "error": f"Invalid JSON data: {e}"}, 400)
+    except msgspec.ValidationError as e:
+        return ojson({"success": False, "error": f"Invalid numeric value: {e}"}, 400)
+    if not req.symbol or not req.type:
+        return ojson({"success": False, "error": "Missing symbol or order type"}, 400)
+    success, result = connector.place_trade(req.symbol, req.volume, req.type, req.sl_distance, req.tp_distance, req.comment, req.magic)
+    if success:
+        # The open positions just changed; don't let a poll serve the cached list
+        _positions_cache.clear()
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/close', methods=['POST'])
 def close():
+    raw = request.get_data(cache=False)
+    if not raw:
+        return ojson({"success": False, "error": "No JSON data provided"}, 400)
     try:
-        data = request.json
-        if not data:
-            return jsonify({"success": False, "error": "No JSON data provided"}), 400
-        ticket = data.get('ticket')
-        volume = data.get('volume')
-        symbol = data.get('symbol')
-        if not ticket:
-            return jsonify({"success": False, "error": "Missing ticket"}), 400
-        try:
-            ticket = int(ticket)
-            volume = float(volume) if volume else None
-        except ValueError as e:
-            return jsonify({"success": False, "error": f"Invalid ticket or volume format: {str(e)}"}), 400
-        success, result = connector.close_trade(ticket, volume, symbol)
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in close endpoint: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        req = close_decoder.decode(raw)
+    except msgspec.DecodeError as e:
+        return ojson({"success": False, "error": f"Invalid JSON data: {e}"}, 400)
+    except msgspec.ValidationError as e:
+        return ojson({"success": False, "error": f"Invalid ticket or volume format: {e}"}, 400)
+    if not req.ticket:
+        return ojson({"success": False, "error": "Missing ticket"}, 400)
+    success, result = connector.close_trade(req.ticket, req.volume, req.symbol)
+    if success:
+        # The open positions just changed; don't let a poll serve the cached list
+        _positions_cache.clear()
+        return ojson({"success": True, "data": result})
+    else:
+        return ojson({"success": False, "error": result}, 400)
 
 @app.route('/positions', methods=['GET'])
 def get_positions():
-    try:
+    # Bots poll this far faster than positions change: reuse the encoded body for a short window
+    # and let clients revalidate with If-None-Match instead of downloading it again
+    msgpack = wants_msgpack()
+    now = time.monotonic()
+    entry = _positions_cache.get(msgpack)
+    if entry is None or now - entry.ts >= POSITIONS_CACHE_TTL:
         success, result = connector.get_positions()
-        if success:
-            return jsonify({"success": True, "data": result})
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in positions endpoint: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3013, "message": str(e)}}), 500
+        if not success:
+            return negotiate({"success": False, "error": result}, 400)
+        response = negotiate({"success": True, "data": result})
+        body = response.get_data()
+        entry = _positions_cache[msgpack] = PositionsEntry(now, body, response.mimetype, hashlib.blake2b(body, digest_size=8).hexdigest())
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.vary.add('Accept')
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
 
 @app.route('/symbol_filling/<symbol>', methods=['GET'])
 def get_symbol_filling(symbol):
     try:
-        success, result = connector.get_symbol_info(symbol)
-        if success:
-            filling_mode = result.get('filling_mode', 0)
-            supported_fillings = []
-            if filling_mode & 1:
-                supported_fillings.append('FOK')
-            if filling_mode & 2:
-                supported_fillings.append('IOC')
-            if filling_mode & 4:
-                supported_fillings.append('RETURN')
-            return jsonify({
-                "success": True,
-                "data": {
-                    "symbol": symbol,
-                    "filling_mode": filling_mode,
-                    "supported_fillings": supported_fillings
-                }
-            })
-        else:
-            return jsonify({"success": False, "error": result}), 400
-    except Exception as e:
-        logger.exception(f"Error in symbol_filling endpoint for {symbol}: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3007, "message": str(e)}}), 500
+        filling_mode, supported_fillings = _symbol_filling_cached(symbol)
+    except KeyError as e:
+        return negotiate({"success": False, "error": e.args[0]}, 400)
+    return negotiate({
+        "success": True,
+        "data": {
+            "symbol": symbol,
+            "filling_mode": filling_mode,
+            "supported_fillings": supported_fillings
+        }
+    })
 
 @app.route('/health', methods=['GET'])
 def health():
-    try:
-        return jsonify({
-            "success": True,
-            "data": {
-                "status": "running",
-                "connected": connector.connected,
-                "active_subscriptions": list(connector.active_subscriptions.keys()),
-                "active_threads": len([t for t in connector.price_threads.values() if t.is_alive()]),
-                "timestamp": datetime.now().isoformat()
-            }
-        })
-    except Exception as e:
-        logger.exception(f"Error in health endpoint: {str(e)}")
-        return jsonify({"success": False, "error": {"code": 3012, "message": str(e)}}), 500
+    # Only the live fields are serialised per probe; the surrounding shape is fixed bytes
+    body = b''.join((
+        _HEALTH_PREFIX,
+        b'true' if connector.connected else b'false',
+        b',"active_subscriptions":',
+        orjson.dumps(tuple(connector.active_subscriptions)),
+        b',"active_threads":',
+        str(connector.active_streams).encode(),
+        b',"timestamp":',
+        repr(time.time()).encode(),
+        b'}}'
+    ))
+    return Response(body, mimetype='application/json')
+
+# Constant error bodies are encoded once at import
+_NOT_FOUND_BODY = orjson.dumps({"success": False, "error": {"code": 404, "message": "Endpoint not found"}})
+_INTERNAL_ERROR_BODY = orjson.dumps({"success": False, "error": {"code": 500, "message": "Internal server error"}})
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"success": False, "error": {"code": 404, "message": "Endpoint not found"}}), 404
+    return Response(_NOT_FOUND_BODY, status=404, mimetype='application/json')
 
 @app.errorhandler(500)
 def internal_error(error):
-    logger.exception(f"Internal server error: {str(error)}")
-    return jsonify({"success": False, "error": {"code": 500, "message": "Internal server error"}}), 500
+    logger.exception("Internal server error: %s", error)
+    return Response(_INTERNAL_ERROR_BODY, status=500, mimetype='application/json')
+
+# Error codes each endpoint reported for unexpected failures before they shared one handler
+_ENDPOINT_ERROR_CODES = {
+    'connect': 3002,
+    'disconnect_endpoint': 3003,
+    'get_symbols': 3004,
+    'get_symbol_info': 3005,
+    'get_price': 3006,
+    'get_symbol_filling': 3007,
+    'health': 3012,
+    'get_positions': 3013
+}
+# /trade and /close have always returned a plain string error, and the Node trading flow parses it
+_PLAIN_ERROR_ENDPOINTS = frozenset(('trade', 'close'))
+
+@app.errorhandler(Exception)
+def unhandled_error(error):
+    # Single exception boundary for every endpoint instead of a try/except per route
+    if isinstance(error, HTTPException):
+        # Keep the exception's own headers (e.g. Allow on a 405) and swap in the JSON body
+        response = error.get_response()
+        response.set_data(orjson.dumps({"success": False, "error": {"code": error.code, "message": error.description}}, option=ORJSON_OPTIONS))
+        response.mimetype = 'application/json'
+        return response
+    logger.exception("Unhandled error in %s %s", request.method, request.path)
+    if request.endpoint in _PLAIN_ERROR_ENDPOINTS:
+        return ojson({"success": False, "error": str(error)}, 500)
+    code = _ENDPOINT_ERROR_CODES.get(request.endpoint, 500)
+    return ojson({"success": False, "error": {"code": code, "message": str(error)}}, 500)
 
 if __name__ == '__main__':
     try:
         logger.info("Starting MT5 WebSocket server...")
-        socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+        # Move bootstrap objects out of the collector's reach and collect gen 0 less often,
+        # so per-tick allocations don't trigger full walks of the Flask/Socket.IO/MT5 object graph
+        gc.collect()
+        gc.freeze()
+        gc.set_threshold(50000, 10, 10)
+        # Served by eventlet.wsgi, not Werkzeug; one process because the MT5 terminal session and the
+        # stream subscriptions live in it. Skip the per-request access log and allow more open sockets.
+        # Keep-alive is already on by default; cap idle HTTP/1.1 connections at 75s so abandoned ones get reaped.
+        socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False, log_output=False, max_size=2000, keepalive=75)
     except KeyboardInterrupt:
         logger.info("Server shutdown requested...")
         connector.disconnect()
-    except Exception as e:
-        logger.exception(f"Failed to start server: {str(e)}")
+    except Exception:
+        logger.exception("Failed to start server")
     finally:
-        logger.info("Server stopped.")
\ No newline at end of file
+        logger.info("Server stopped.")
+        log_listener.stop()
\ No newline at end of file
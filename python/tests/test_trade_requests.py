@@ -0,0 +1,43 @@
+import msgspec
+import pytest
+
+from trade_requests import close_decoder, trade_decoder
+
+
+def test_trade_empty_distances_mean_not_set():
+    req = trade_decoder.decode(b'{"symbol": "XAUUSD", "type": "BUY", "volume": 0.1, "sl_distance": "", "tp_distance": ""}')
+    assert req.sl_distance is None
+    assert req.tp_distance is None
+
+
+def test_trade_numeric_strings_are_coerced():
+    req = trade_decoder.decode(b'{"symbol": "XAUUSD", "type": "SELL", "volume": "0.5", "sl_distance": "1.5", "magic": "123456"}')
+    assert req.volume == 0.5
+    assert req.sl_distance == 1.5
+    assert req.magic == 123456
+
+
+def test_trade_missing_type_is_left_for_the_handler():
+    req = trade_decoder.decode(b'{"symbol": "XAUUSD", "type": null}')
+    assert req.type is None
+    assert req.volume == 0.1
+
+
+def test_trade_empty_volume_is_rejected():
+    with pytest.raises(msgspec.ValidationError):
+        trade_decoder.decode(b'{"symbol": "XAUUSD", "type": "BUY", "volume": ""}')
+
+
+def test_close_empty_volume_means_full_close():
+    req = close_decoder.decode(b'{"ticket": "42", "volume": ""}')
+    assert req.ticket == 42
+    assert req.volume is None
+
+
+def test_close_missing_ticket_is_left_for_the_handler():
+    assert close_decoder.decode(b'{"volume": 0.1}').ticket is None
+
+
+def test_close_invalid_ticket_is_rejected():
+    with pytest.raises(msgspec.ValidationError):
+        close_decoder.decode(b'{"ticket": "abc"}')
@@ -0,0 +1,39 @@
+# Request bodies for /trade and /close. Fields accept numbers or numeric strings the way the
+# handlers' old float()/int() calls did, and empty values for the optional ones mean "not set".
+import msgspec
+
+
+def _optional_float(value):
+    return float(value) if value else None
+
+
+class TradeReq(msgspec.Struct):
+    symbol: str | None = None
+    type: str | None = None
+    volume: float | str = 0.1
+    sl_distance: float | str | None = None
+    tp_distance: float | str | None = None
+    comment: str = ''
+    magic: int | float | str = 0
+
+    def __post_init__(self):
+        # ValueError raised here surfaces as msgspec.ValidationError from the decoder
+        self.volume = float(self.volume)
+        self.sl_distance = _optional_float(self.sl_distance)
+        self.tp_distance = _optional_float(self.tp_distance)
+        self.magic = int(self.magic)
+
+
+class CloseReq(msgspec.Struct):
+    ticket: int | float | str | None = None
+    volume: float | str | None = None
+    symbol: str | None = None
+
+    def __post_init__(self):
+        # A missing ticket is left for the handler to report as "Missing ticket"
+        self.ticket = int(self.ticket) if self.ticket else None
+        self.volume = _optional_float(self.volume)
+
+
+trade_decoder = msgspec.json.Decoder(TradeReq)
+close_decoder = msgspec.json.Decoder(CloseReq)
@@ -1,7 +1,16 @@
 import axios from "axios";
+import https from "https";
 import dotenv from "dotenv";
 dotenv.config();
 const BASE_URL = "https://venuemt5.aurify.ae"; // Adjust to your Python API URL
+// Reuse TCP/TLS connections to the MT5 API instead of a fresh handshake per poll.
+// BASE_URL is served through the TLS proxy in front of the Python API, so it is the proxy's idle
+// timeout that closes pooled sockets. Drop them first so a request never goes out on a socket the
+// proxy has just closed (ECONNRESET); set MT5_HTTP_IDLE_TIMEOUT_MS below the proxy's real value.
+const MT5_HTTP_IDLE_TIMEOUT_MS = parseInt(process.env.MT5_HTTP_IDLE_TIMEOUT_MS) || 30000;
+const mt5Http = axios.create({
+  httpsAgent: new https.Agent({ keepAlive: true, timeout: MT5_HTTP_IDLE_TIMEOUT_MS }),
+});
 
 class MT5Service {
   constructor() {
@@ -12,7 +21,7 @@ class MT5Service {
 
   async connect() {
     try {
-      const response = await axios.post(`${BASE_URL}/connect`, {
+      const response = await mt5Http.post(`${BASE_URL}/connect`, {
         server: process.env.MT5_SERVER,
         login: parseInt(process.env.MT5_LOGIN),
         password: process.env.MT5_PASSWORD,
@@ -27,7 +36,7 @@ class MT5Service {
 
   async disconnect() {
     try {
-      const response = await axios.post(`${BASE_URL}/disconnect`);
+      const response = await mt5Http.post(`${BASE_URL}/disconnect`);
       this.isConnected = false;
       return response.data.message;
     } catch (error) {
@@ -38,7 +47,7 @@ class MT5Service {
 
   async getSymbols() {
     try {
-      const response = await axios.get(`${BASE_URL}/symbols`);
+      const response = await mt5Http.get(`${BASE_URL}/symbols`);
       return response.data.data;
     } catch (error) {
       console.error("Symbol fetch failed:", error.message);
@@ -50,7 +59,7 @@ class MT5Service {
     try {
       // Ensure proper URL encoding for special characters like #
       const encodedSymbol = encodeURIComponent(symbol);
-      const response = await axios.get(
+      const response = await mt5Http.get(
         `${BASE_URL}/symbol_info/${encodedSymbol}`
       );
       return response.data.data;
@@ -63,7 +72,7 @@ class MT5Service {
   async getPrice(symbol = process.env.MT5_SYMBOL || "XAUUSD_TTBAR.Fix") {
     try {
       const encodedSymbol = encodeURIComponent(symbol);
-      const response = await axios.get(`${BASE_URL}/price/${encodedSymbol}`);
+      const response = await mt5Http.get(`${BASE_URL}/price/${encodedSymbol}`);
       const priceData = response.data.data;
       this.priceData.set(symbol, {
         bid: priceData.bid,
@@ -134,7 +143,7 @@ class MT5Service {
       };
 
       console.log("Sending trade request:", JSON.stringify(request, null, 2));
-      const response = await axios.post(`${BASE_URL}/trade`, request);
+      const response = await mt5Http.post(`${BASE_URL}/trade`, request);
       console.log("API response:", JSON.stringify(response.data, null, 2));
       const result = response.data.data;
       if (!response.data.success)
@@ -225,7 +234,7 @@ class MT5Service {
           volume: parseFloat(tradeData.volume),
           type: tradeData.type.toUpperCase(),
         };
-        const response = await axios.post(`${BASE_URL}/close`, request);
+        const response = await mt5Http.post(`${BASE_URL}/close`, request);
         const result = response.data.data;
 
         if (!result || typeof result !== "object") {
@@ -334,7 +343,7 @@ class MT5Service {
         )} with price ${closePrice}`
       );
 
-      const response = await axios.post(`${BASE_URL}/close`, request);
+      const response = await mt5Http.post(`${BASE_URL}/close`, request);
       const result = response.data.data;
       if (!result || typeof result !== "object") {
         throw new Error(
@@ -441,7 +450,7 @@ class MT5Service {
 
   async getPositions() {
     try {
-      const response = await axios.get(`${BASE_URL}/positions`);
+      const response = await mt5Http.get(`${BASE_URL}/positions`);
       return response.data.data;
     } catch (error) {
       console.error("Positions fetch failed:", error.message);